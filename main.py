@@ -9,7 +9,7 @@ from rich.markdown import Markdown
 
 from application import sent_analysis
 from review_summary import review_cli
-from search_engine import cli
+from search_engine import cli, semantic
 
 warnings.filterwarnings("ignore")
 load_dotenv(find_dotenv())
@@ -40,6 +40,15 @@ def setup():
         raise
 
 
+def semantic_setup():
+    # Semantic review search is opt-in: point SEMANTIC_INDEX_PATH at a directory
+    # built with `python -m search_engine.semantic build`.
+    path = os.environ.get("SEMANTIC_INDEX_PATH")
+    if not path:
+        return None
+    return semantic.SemanticIndex(path)
+
+
 def review(es):
     review_summary = review_cli.ReviewSummary(es)
     review_summary.instructions()
@@ -67,8 +76,8 @@ def review(es):
             )
 
 
-def business(es):
-    search_engine = cli.SearchEngine(es)
+def business(es, semantic_index=None):
+    search_engine = cli.SearchEngine(es, semantic_index)
     search_engine.instructions()
     while True:
         query = input("SEARCH: ").strip().lower()
@@ -117,6 +126,7 @@ def app(es):
 
 def main():
     es = setup()
+    semantic_index = semantic_setup()
 
     while True:
         query = input("QUERY: ").strip().lower().split()
@@ -134,7 +144,7 @@ def main():
             review(es)
             print()
         elif query[0] == "search":
-            business(es)
+            business(es, semantic_index)
             print()
         elif query[0] == "app":
             app(es)
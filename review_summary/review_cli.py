@@ -11,6 +11,8 @@ from rich.console import Console
 from rich.markdown import Markdown
 from rich.table import Table
 
+from search_engine import partitions
+
 nltk.download("punkt", quiet=True)
 nltk.download("stopwords", quiet=True)
 stop_words = set(stopwords.words("english"))
@@ -34,7 +36,7 @@ class ReviewSummary:
         markdown = Markdown(instructions)
         console.print(markdown)
 
-    def get_user_reviews_from_es(self, user_id, index_name="review_index"):
+    def get_user_reviews_from_es(self, user_id, index_name=partitions.review_alias):
         query = {
             "query": {"term": {"user_id": user_id}},
             "aggs": {
@@ -45,7 +47,8 @@ class ReviewSummary:
         }
 
         try:
-            response = self.es.search(index=index_name, body=query)
+            # Reviews are routed by user_id, so only that user's shards are searched.
+            response = self.es.search(index=index_name, body=query, routing=user_id)
 
             review_count = response["aggregations"]["review_count"]["value"]
             business_ids = [
@@ -76,7 +79,9 @@ class ReviewSummary:
         Xmax, Ymax = X + dX, Y + dY
         return (Xmin, Ymin, Xmax, Ymax)
 
-    def get_bounding_box(self, business_ids, index_name="business_data", top_n=10):
+    def get_bounding_box(
+        self, business_ids, index_name=partitions.business_alias, top_n=10
+    ):
 
         response = self.es.search(
             index=index_name,
@@ -87,6 +92,7 @@ class ReviewSummary:
                     ]
                 }
             },
+            routing=partitions.routing_keys(business_ids),
             size=top_n,
         )
 
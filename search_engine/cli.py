@@ -1,24 +1,34 @@
+import time
 import warnings
 
 from dotenv import find_dotenv, load_dotenv
+from elasticsearch import NotFoundError
 from nltk.corpus import wordnet as wn
 from rich import print
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.table import Table
 
+from search_engine import partitions, semantic
+
 warnings.filterwarnings("ignore")
 load_dotenv(find_dotenv())
 
-business_index = "business_data"
-review_index = "review_index"
+business_index = partitions.business_alias
+review_index = partitions.review_alias
+
+# How long partition bounds are trusted before re-reading them, so partitions
+# added or swapped by ingest are picked up by a running CLI.
+partition_bounds_ttl = 60
 
 console = Console()
 
 
 class SearchEngine:
-    def __init__(self, es):
+    def __init__(self, es, semantic_index=None):
         self.es = es
+        self.partition_bounds = {}
+        self.semantic_index = semantic_index
 
     def instructions(self):
         instructions = """
@@ -51,6 +61,9 @@ class SearchEngine:
         return alternate_phrase.strip()
 
     def search_reviews(self, phrase, top_n=10):
+        if self.semantic_index is not None:
+            return self.search_reviews_semantic(phrase, top_n)
+
         all_phrases = [phrase, self.get_alternate_phrase(phrase)]
         search_query = {
             "query": {
@@ -62,6 +75,36 @@ class SearchEngine:
         response = self.es.search(index=review_index, body=search_query, size=top_n)
         return response
 
+    def search_reviews_semantic(self, phrase, top_n=10, rrf_k=60):
+        # Nearest neighbour hits stand in for the synonym clause, and both
+        # rankings are fused by reciprocal rank.
+        bm25 = self.es.search(
+            index=review_index, query={"match": {"text": phrase}}, size=top_n
+        )
+        bm25_ids = [hit["_id"] for hit in bm25["hits"]["hits"]]
+        ann_ids = [
+            review_id for review_id, _ in self.semantic_index.search(phrase, top_n)
+        ]
+        fused = semantic.reciprocal_rank_fusion(
+            [bm25_ids, ann_ids], k=rrf_k, top_n=top_n
+        )
+
+        docs = {hit["_id"]: hit for hit in bm25["hits"]["hits"]}
+        missing = [review_id for review_id, _ in fused if review_id not in docs]
+        if missing:
+            response = self.es.search(
+                index=review_index,
+                query={"ids": {"values": missing}},
+                size=len(missing),
+            )
+            docs.update({hit["_id"]: hit for hit in response["hits"]["hits"]})
+
+        hits = []
+        for review_id, score in fused:
+            if review_id in docs:
+                hits.append({**docs[review_id], "_score": score})
+        return {"hits": {"hits": hits}}
+
     def search_business(self, phrase, top_n=10):
         all_phrases = [phrase, self.get_alternate_phrase(phrase)]
         search_query = {
@@ -135,21 +178,59 @@ class SearchEngine:
             review_table.add_column("Business Name", width=30)
             review_table.add_column("Review", width=70)
             review_table.add_column("Score", width=20)
+            business_names = self.get_business_names(
+                [hit["_source"]["business_id"] for hit in reviews]
+            )
             for i, hit in enumerate(reviews):
-                business_name = self.es.get(
-                    index=business_index, id=hit["_source"]["business_id"]
-                )["_source"]["name"]
                 review_table.add_row(
                     str(i + 1),
                     hit["_id"],
-                    business_name,
+                    business_names.get(hit["_source"]["business_id"], ""),
                     hit["_source"]["text"],
                     str(hit["_score"]),
                 )
             console.print(review_table)
 
+    def get_business_names(self, business_ids):
+        # A get by id can't target an alias spanning several partitions, so look
+        # the businesses up with one routed ids query instead.
+        business_ids = list(dict.fromkeys(business_ids))
+        if not business_ids:
+            return {}
+        response = self.es.search(
+            index=business_index,
+            query={"ids": {"values": business_ids}},
+            routing=partitions.routing_keys(business_ids),
+            source=["name"],
+            size=len(business_ids),
+        )
+        return {hit["_id"]: hit["_source"]["name"] for hit in response["hits"]["hits"]}
+
+    def get_location_partitions(
+        self, top_left, bottom_right, index_name, refresh=False
+    ):
+        loaded_at, bounds = self.partition_bounds.get(index_name, (0, None))
+        if (
+            refresh
+            or bounds is None
+            or time.monotonic() - loaded_at > partition_bounds_ttl
+        ):
+            bounds = partitions.get_partition_bounds(self.es, index_name)
+            self.partition_bounds[index_name] = (time.monotonic(), bounds)
+        return partitions.route_partitions(bounds, top_left, bottom_right)
+
+    def search_location_partitions(
+        self, top_left, bottom_right, index_name, search_query, top_n, refresh=False
+    ):
+        indices = self.get_location_partitions(
+            top_left, bottom_right, index_name, refresh
+        )
+        if not indices:
+            return None
+        return self.es.search(index=",".join(indices), body=search_query, size=top_n)
+
     def search_business_by_location(
-        self, top_left, bottom_right, top_n=10, index_name="business_data"
+        self, top_left, bottom_right, top_n=10, index_name=business_index
     ):
         search_query = {
             "query": {
@@ -158,7 +239,19 @@ class SearchEngine:
                 }
             }
         }
-        response = self.es.search(index=index_name, body=search_query, size=top_n)
+        try:
+            response = self.search_location_partitions(
+                top_left, bottom_right, index_name, search_query, top_n
+            )
+        except NotFoundError:
+            # A rebuild swapped the partitions since the bounds were cached.
+            response = self.search_location_partitions(
+                top_left, bottom_right, index_name, search_query, top_n, refresh=True
+            )
+        if response is None:
+            print("\nNo businesses indexed within the given location.")
+            return
+
         print("\nSearch Results for Location:")
         for hit in response["hits"]["hits"]:
             print(
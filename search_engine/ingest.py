@@ -0,0 +1,763 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+
+import pandas as pd
+from dotenv import find_dotenv, load_dotenv
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+from search_engine import partitions
+
+load_dotenv(find_dotenv())
+
+checkpoint_path = "ingest_checkpoint.db"
+
+schema = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    run_id INTEGER NOT NULL,
+    full_scan INTEGER NOT NULL,
+    rebuild INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    inode INTEGER,
+    read_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS generations (
+    alias TEXT PRIMARY KEY,
+    generation INTEGER,
+    run_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    alias TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    index_name TEXT NOT NULL,
+    routing TEXT,
+    parent TEXT,
+    run_id INTEGER NOT NULL,
+    PRIMARY KEY (alias, doc_id)
+);
+CREATE INDEX IF NOT EXISTS docs_parent ON docs (alias, parent);
+CREATE TABLE IF NOT EXISTS pending (
+    alias TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    row TEXT NOT NULL,
+    PRIMARY KEY (alias, doc_id)
+);
+CREATE TABLE IF NOT EXISTS skipped (
+    alias TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    PRIMARY KEY (alias, doc_id)
+);
+"""
+
+# Bytes hashed at each end of the already-read part of a source file.
+identity_bytes = 65536
+
+
+class CheckpointStore:
+    # Local sqlite record of how far each source file has been read and the
+    # content hash of every document already sent to Elasticsearch.
+    def __init__(self, path=checkpoint_path):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(schema)
+
+    def get_source(self, path):
+        row = self.conn.execute(
+            "SELECT * FROM sources WHERE path = ?", (path,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def save_source(self, source):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sources VALUES "
+            "(:path, :kind, :offset, :run_id, :full_scan, :rebuild, :complete, "
+            ":inode, :read_hash)",
+            source,
+        )
+
+    def get_generation(self, alias):
+        row = self.conn.execute(
+            "SELECT generation FROM generations WHERE alias = ?", (alias,)
+        ).fetchone()
+        return row["generation"] if row else None
+
+    def set_generation(self, alias, generation):
+        self.conn.execute(
+            "UPDATE generations SET generation = ? WHERE alias = ?",
+            (generation, alias),
+        )
+
+    def next_run_id(self, alias):
+        # Run ids double as rebuild generations and "seen" markers, so they are
+        # counted per alias rather than per source file.
+        self.conn.execute(
+            "INSERT INTO generations VALUES (?, NULL, 1) "
+            "ON CONFLICT(alias) DO UPDATE SET run_id = run_id + 1",
+            (alias,),
+        )
+        return self.conn.execute(
+            "SELECT run_id FROM generations WHERE alias = ?", (alias,)
+        ).fetchone()["run_id"]
+
+    def business_loaded(self):
+        row = self.conn.execute(
+            "SELECT 1 FROM sources WHERE kind = 'business' AND complete = 1"
+        ).fetchone()
+        return row is not None
+
+    def rebuild_run(self, kind):
+        row = self.conn.execute(
+            "SELECT run_id FROM sources WHERE kind = ? AND rebuild = 1 "
+            "AND complete = 0",
+            (kind,),
+        ).fetchone()
+        return row["run_id"] if row else None
+
+    def select_in(self, query, params, values, chunk_size=500):
+        values = list(values)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start : start + chunk_size]
+            yield from self.conn.execute(
+                query.format(",".join("?" * len(chunk))), [*params, *chunk]
+            )
+
+    def get_docs(self, alias, doc_ids):
+        rows = self.select_in(
+            "SELECT * FROM docs WHERE alias = ? AND doc_id IN ({})", [alias], doc_ids
+        )
+        return {row["doc_id"]: dict(row) for row in rows}
+
+    def get_children(self, alias, parents):
+        rows = self.select_in(
+            "SELECT * FROM docs WHERE alias = ? AND parent IN ({})", [alias], parents
+        )
+        return [dict(row) for row in rows]
+
+    def save_docs(self, docs):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO docs VALUES (:alias, :doc_id, :hash, :state, "
+            ":index_name, :routing, :parent, :run_id)",
+            docs,
+        )
+
+    def mark_seen(self, alias, doc_ids, run_id):
+        self.conn.executemany(
+            "UPDATE docs SET run_id = ? WHERE alias = ? AND doc_id = ?",
+            [(run_id, alias, doc_id) for doc_id in doc_ids],
+        )
+
+    def get_unseen(self, alias, run_id, states=None):
+        query, params = "SELECT * FROM docs WHERE alias = ? AND run_id != ?", [
+            alias,
+            run_id,
+        ]
+        if states:
+            query += f" AND state IN ({','.join('?' * len(states))})"
+            params += sorted(states)
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+    def delete_docs(self, alias, doc_ids):
+        self.conn.executemany(
+            "DELETE FROM docs WHERE alias = ? AND doc_id = ?",
+            [(alias, doc_id) for doc_id in doc_ids],
+        )
+
+    def save_skipped(self, alias, doc_ids):
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO skipped VALUES (?, ?)",
+            [(alias, doc_id) for doc_id in doc_ids],
+        )
+
+    def delete_skipped(self, alias, doc_ids):
+        self.conn.executemany(
+            "DELETE FROM skipped WHERE alias = ? AND doc_id = ?",
+            [(alias, doc_id) for doc_id in doc_ids],
+        )
+
+    def get_skipped(self, alias, doc_ids):
+        rows = self.select_in(
+            "SELECT doc_id FROM skipped WHERE alias = ? AND doc_id IN ({})",
+            [alias],
+            doc_ids,
+        )
+        return {row["doc_id"] for row in rows}
+
+    def save_pending(self, alias, rows, id_field, parent_field):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO pending VALUES (?, ?, ?, ?)",
+            [
+                (alias, row[id_field], row[parent_field], json.dumps(row))
+                for row in rows
+            ],
+        )
+
+    def get_ready_pending(self, alias, parent_alias, after, limit):
+        # One page of waiting rows whose parent has been ingested since, in
+        # rowid order so the caller can carry on from the last rowid it saw.
+        rows = self.conn.execute(
+            "SELECT pending.rowid AS position, pending.row FROM pending "
+            "JOIN docs ON docs.alias = ? AND docs.doc_id = pending.parent "
+            "WHERE pending.alias = ? AND pending.rowid > ? "
+            "ORDER BY pending.rowid LIMIT ?",
+            (parent_alias, alias, after, limit),
+        )
+        return [(row["position"], json.loads(row["row"])) for row in rows]
+
+    def drop_skipped_pending(self, alias, parent_alias):
+        self.conn.execute(
+            "DELETE FROM pending WHERE alias = ? AND parent IN "
+            "(SELECT doc_id FROM skipped WHERE alias = ?)",
+            (alias, parent_alias),
+        )
+
+    def delete_pending(self, alias, doc_ids):
+        self.conn.executemany(
+            "DELETE FROM pending WHERE alias = ? AND doc_id = ?",
+            [(alias, doc_id) for doc_id in doc_ids],
+        )
+
+    def clear_pending(self, alias):
+        self.conn.execute("DELETE FROM pending WHERE alias = ?", (alias,))
+
+    def count_pending(self, alias):
+        return self.conn.execute(
+            "SELECT COUNT(*) AS n FROM pending WHERE alias = ?", (alias,)
+        ).fetchone()["n"]
+
+    def commit(self):
+        self.conn.commit()
+
+
+def clean_boolean(value):
+    if isinstance(value, str):
+        return value.lower() == "true"
+    return bool(value) if value is not None else None
+
+
+def business_doc(row):
+    attributes = row.get("attributes")
+    row["attributes"] = (
+        {
+            "BusinessAcceptsCreditCards": clean_boolean(
+                attributes.get("BusinessAcceptsCreditCards")
+            )
+        }
+        if isinstance(attributes, dict)
+        else {}
+    )
+    row["hours"] = row.get("hours") or {}
+    row["categories"] = row.get("categories") or "Unknown"
+    row["is_open"] = bool(row.get("is_open"))
+    row["business_id"] = str(row["business_id"])
+    row["name"] = str(row.get("name"))
+    row["postal_code"] = str(row.get("postal_code"))
+    row["state"] = partitions.normalize_state(row.get("state"))
+    row["location"] = {"lat": row["latitude"], "lon": row["longitude"]}
+    return row
+
+
+def review_doc(row):
+    # The raw dump uses "YYYY-MM-DD HH:MM:SS", which the date mapping rejects.
+    if isinstance(row.get("date"), str):
+        row["date"] = row["date"].replace(" ", "T")
+    return row
+
+
+kinds = {
+    "business": {
+        "alias": partitions.business_alias,
+        "mapping": partitions.business_mapping,
+        "id": "business_id",
+        "routing": None,
+        "parent": None,
+        "doc": business_doc,
+    },
+    "review": {
+        "alias": partitions.review_alias,
+        "mapping": partitions.review_mapping,
+        "id": "review_id",
+        "routing": "user_id",
+        "parent": "business_id",
+        "doc": review_doc,
+    },
+}
+
+
+def content_hash(doc):
+    return hashlib.sha1(
+        json.dumps(doc, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def read_lines(path, offset):
+    # Yields each JSON line with the byte offset just past it, so a checkpoint
+    # always points at the start of an unread line.
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A partially written last line is left for the next run.
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    return
+            else:
+                row = json.loads(line) if line.strip() else None
+            offset += len(line)
+            yield row, offset
+
+
+def file_identity(path, offset):
+    # Inode plus a hash of both ends of the part already read. Appending keeps
+    # both, while a dump replaced in place changes at least one of them.
+    with open(path, "rb") as f:
+        head = f.read(min(offset, identity_bytes))
+        f.seek(max(offset - identity_bytes, 0))
+        tail = f.read(min(offset, identity_bytes))
+    return os.stat(path).st_ino, hashlib.sha1(head + tail).hexdigest()
+
+
+def source_changed(path, source):
+    if source["offset"] > os.path.getsize(path):
+        return True
+    inode, read_hash = file_identity(path, source["offset"])
+    return inode != source["inode"] or read_hash != source["read_hash"]
+
+
+class Ingest:
+    def __init__(self, es, store, kind, states=None):
+        self.es = es
+        self.store = store
+        self.kind = kind
+        self.config = kinds[kind]
+        self.alias = self.config["alias"]
+        self.states = (
+            {partitions.normalize_state(state) for state in states} if states else None
+        )
+        self.partitions = set()
+        self.reviews = Ingest(es, store, "review") if kind == "business" else None
+
+    def start_run(self, path, full_scan, rebuild):
+        source = self.store.get_source(path)
+        changed = source is not None and source_changed(path, source)
+        if source and not source["complete"] and not changed:
+            print(
+                f"Resuming run {source['run_id']} of {path} "
+                f"from byte {source['offset']}"
+            )
+            return source
+
+        if changed:
+            print(f"{path} changed since the last run, rescanning it in full.")
+            rebuild = rebuild or bool(source["rebuild"] and not source["complete"])
+        if rebuild or full_scan or changed or source is None:
+            full_scan = True
+            offset = 0
+        else:
+            offset = source["offset"]
+        if full_scan:
+            # Every waiting review is read again by a full scan.
+            self.store.clear_pending(self.alias)
+
+        inode, read_hash = file_identity(path, offset)
+        source = {
+            "path": path,
+            "kind": self.kind,
+            "offset": offset,
+            "run_id": self.store.next_run_id(self.alias),
+            "full_scan": int(full_scan),
+            "rebuild": int(rebuild),
+            "complete": 0,
+            "inode": inode,
+            "read_hash": read_hash,
+        }
+        self.store.save_source(source)
+        self.store.commit()
+        return source
+
+    def generation(self, source):
+        if source["rebuild"]:
+            return source["run_id"]
+        return self.store.get_generation(self.alias)
+
+    def partition(self, state, generation, live=True):
+        key = (state, generation)
+        if key not in self.partitions:
+            index_name = partitions.partition_name(self.alias, state, generation)
+            if not live and self.es.indices.exists_alias(
+                name=self.alias, index=index_name
+            ):
+                raise RuntimeError(
+                    f"Refusing to rebuild into '{index_name}', which is live "
+                    f"behind '{self.alias}'."
+                )
+            partitions.create_partition(
+                self.es,
+                self.alias,
+                state,
+                self.config["mapping"],
+                generation=generation,
+                live=live,
+            )
+            self.partitions.add(key)
+        return partitions.partition_name(self.alias, state, generation)
+
+    def doc_states(self, rows):
+        if self.kind == "business":
+            return {
+                row["business_id"]: row["state"]
+                for row in rows
+                if self.states is None or row["state"] in self.states
+            }
+        # Reviews live in the partition of the business they belong to.
+        businesses = self.store.get_docs(
+            partitions.business_alias, {row["business_id"] for row in rows}
+        )
+        return {
+            row["review_id"]: businesses[row["business_id"]]["state"]
+            for row in rows
+            if row["business_id"] in businesses
+        }
+
+    def process_batch(self, rows, source):
+        id_field, routing_field = self.config["id"], self.config["routing"]
+        parent_field = self.config["parent"]
+        generation = self.generation(source)
+        live = not source["rebuild"]
+        states = self.doc_states(rows)
+        existing = self.store.get_docs(self.alias, states)
+
+        actions, changed, unchanged, moved = [], [], [], {}
+        for row in rows:
+            doc_id = row[id_field]
+            if doc_id not in states:
+                continue
+            doc_hash = content_hash(row)
+            previous = existing.get(doc_id)
+            if previous and previous["hash"] == doc_hash and not source["rebuild"]:
+                unchanged.append(doc_id)
+                continue
+
+            index_name = self.partition(states[doc_id], generation, live)
+            routing = row[routing_field] if routing_field else None
+            # A rebuild leaves copies in the old generation to the alias swap,
+            # but one it wrote itself earlier must not survive next to this one.
+            if (
+                previous
+                and previous["index_name"] != index_name
+                and (live or previous["run_id"] == source["run_id"])
+            ):
+                actions.append(delete_action(previous))
+            if previous and previous["state"] != states[doc_id]:
+                moved[doc_id] = states[doc_id]
+            action = {"_index": index_name, "_id": doc_id, "_source": row}
+            if routing:
+                action["_routing"] = routing
+            actions.append(action)
+            changed.append(
+                {
+                    "alias": self.alias,
+                    "doc_id": doc_id,
+                    "hash": doc_hash,
+                    "state": states[doc_id],
+                    "index_name": index_name,
+                    "routing": routing,
+                    "parent": row[parent_field] if parent_field else None,
+                    "run_id": source["run_id"],
+                }
+            )
+
+        if actions:
+            bulk(self.es, actions, ignore_status=(404,))
+        if self.kind == "business" and changed:
+            changed_ids = {doc["doc_id"] for doc in changed}
+            df = pd.DataFrame([row for row in rows if row[id_field] in changed_ids])
+            for state, state_df in df.groupby("state"):
+                partitions.extend_partition_bounds(
+                    self.es,
+                    self.partition(state, generation, live),
+                    partitions.state_bounds(state_df),
+                )
+        self.store.save_docs(changed)
+        self.store.mark_seen(self.alias, unchanged, source["run_id"])
+
+        counts = Counter(upserted=len(changed), unchanged=len(unchanged))
+        unresolved = [row for row in rows if row[id_field] not in states]
+        if self.kind == "business":
+            counts += self.reviews.follow_businesses(moved)
+            # Reviews of businesses left out by --states are dropped rather than
+            # kept waiting for a business that will never arrive.
+            self.store.save_skipped(self.alias, [row[id_field] for row in unresolved])
+            self.store.delete_skipped(self.alias, states)
+            counts["skipped"] = len(unresolved)
+        else:
+            skipped = self.store.get_skipped(
+                partitions.business_alias, {row[parent_field] for row in unresolved}
+            )
+            # Reviews of businesses not ingested yet wait in the checkpoint and
+            # are retried at the start of every review run.
+            self.store.save_pending(
+                self.alias,
+                [row for row in unresolved if row[parent_field] not in skipped],
+                id_field,
+                parent_field,
+            )
+            self.store.delete_pending(self.alias, states)
+            counts["skipped"] = sum(row[parent_field] in skipped for row in unresolved)
+        return counts
+
+    def follow_businesses(self, business_states, chunk_size=500):
+        # Reviews live in their business's partition, so they move with a
+        # business that changed state and are deleted with one that is gone
+        # (a state of None). The stored source is fetched with a realtime mget.
+        counts = Counter()
+        if not business_states:
+            return counts
+        rebuild = self.store.rebuild_run(self.kind)
+        generation = self.store.get_generation(self.alias)
+        docs = self.store.get_children(self.alias, business_states)
+        for start in range(0, len(docs), chunk_size):
+            chunk = docs[start : start + chunk_size]
+            targets = {}
+            for doc in chunk:
+                state = business_states[doc["parent"]]
+                if state is None:
+                    continue
+                # Reviews already written by an unfinished rebuild stay in its
+                # generation, everything else moves within the live one.
+                if doc["run_id"] == rebuild:
+                    targets[doc["doc_id"]] = self.partition(state, rebuild, live=False)
+                else:
+                    targets[doc["doc_id"]] = self.partition(state, generation)
+
+            found = {}
+            if targets:
+                # The target is looked up too, in case a crash lost the
+                # checkpoint of a move that already reached Elasticsearch.
+                response = self.es.mget(
+                    docs=[
+                        {
+                            "_index": index,
+                            "_id": doc["doc_id"],
+                            "routing": doc["routing"],
+                        }
+                        for doc in chunk
+                        if doc["doc_id"] in targets
+                        for index in (doc["index_name"], targets[doc["doc_id"]])
+                    ]
+                )
+                found = {
+                    (hit["_index"], hit["_id"]): hit["_source"]
+                    for hit in response["docs"]
+                    if hit.get("found")
+                }
+
+            actions, moved, gone = [], [], []
+            for doc in chunk:
+                doc_id, target = doc["doc_id"], targets.get(doc["doc_id"])
+                row = found.get((doc["index_name"], doc_id))
+                if row is not None or target is None:
+                    actions.append(delete_action(doc))
+                if target is not None and row is not None:
+                    action = {"_index": target, "_id": doc_id, "_source": row}
+                    if doc["routing"]:
+                        action["_routing"] = doc["routing"]
+                    actions.append(action)
+                if target is not None and (
+                    row is not None or (target, doc_id) in found
+                ):
+                    moved.append(
+                        {
+                            **doc,
+                            "state": business_states[doc["parent"]],
+                            "index_name": target,
+                        }
+                    )
+                else:
+                    # Deleted with its business, or missing from Elasticsearch,
+                    # in which case the next full scan writes it again.
+                    gone.append(doc_id)
+            if actions:
+                bulk(self.es, actions, ignore_status=(404,))
+            self.store.save_docs(moved)
+            self.store.delete_docs(self.alias, gone)
+            counts.update(reviews_moved=len(moved), reviews_deleted=len(gone))
+        return counts
+
+    def finish(self, source):
+        counts = Counter()
+        if source["full_scan"]:
+            # A --states run only saw its own states, so only those can be stale.
+            stale = self.store.get_unseen(self.alias, source["run_id"], self.states)
+            if not source["rebuild"] and stale:
+                bulk(
+                    self.es,
+                    [delete_action(doc) for doc in stale],
+                    ignore_status=(404,),
+                )
+            stale_ids = [doc["doc_id"] for doc in stale]
+            self.store.delete_docs(self.alias, stale_ids)
+            counts["deleted"] = len(stale)
+            if self.kind == "business":
+                # Their reviews go now and any that turn up later are skipped.
+                counts += self.reviews.follow_businesses(dict.fromkeys(stale_ids))
+                self.store.save_skipped(self.alias, stale_ids)
+
+        if source["rebuild"]:
+            # Every document now lives in the new generation, so the alias can
+            # move over in one atomic update and the old indices are dropped.
+            new_indices = [
+                partitions.partition_name(self.alias, state, source["run_id"])
+                for state, generation in self.partitions
+                if generation == source["run_id"]
+            ]
+            partitions.swap_alias(self.es, self.alias, new_indices)
+            self.store.set_generation(self.alias, source["run_id"])
+
+        source["complete"] = 1
+        self.store.save_source(source)
+        self.store.commit()
+        return counts
+
+    def run(self, path, full_scan=False, rebuild=False, batch_size=1000):
+        if self.kind == "review" and not self.store.business_loaded():
+            raise RuntimeError(
+                "Reviews are partitioned by their business's state; "
+                "finish a business ingest first."
+            )
+        if not rebuild and partitions.legacy_index(self.es, self.alias):
+            print(f"'{self.alias}' is still a single index, rebuilding it.")
+            rebuild = True
+        if rebuild and self.states:
+            raise ValueError(
+                "A rebuild replaces every state's partition; run it without states."
+            )
+
+        source = self.start_run(path, full_scan, rebuild)
+        if source["rebuild"]:
+            # Re-register the new generation's partitions when resuming.
+            rows = self.store.conn.execute(
+                "SELECT DISTINCT state FROM docs WHERE alias = ? AND run_id = ?",
+                (self.alias, source["run_id"]),
+            )
+            for row in rows:
+                self.partition(row["state"], source["run_id"], live=False)
+
+        counts = Counter()
+        if self.kind == "review":
+            self.store.drop_skipped_pending(self.alias, partitions.business_alias)
+            # Only reviews whose business has arrived are read back, a page at
+            # a time; the rest stay put until a later business run.
+            position = 0
+            while True:
+                page = self.store.get_ready_pending(
+                    self.alias, partitions.business_alias, position, batch_size
+                )
+                if not page:
+                    break
+                position = page[-1][0]
+                counts += self.process_batch([row for _, row in page], source)
+            self.store.commit()
+
+        batch = []
+        offset = source["offset"]
+        for row, offset in read_lines(path, source["offset"]):
+            if row is not None:
+                batch.append(self.config["doc"](row))
+            if len(batch) >= batch_size:
+                counts += self.process_batch(batch, source)
+                batch = []
+                self.checkpoint(source, offset)
+        if batch:
+            counts += self.process_batch(batch, source)
+        self.checkpoint(source, offset)
+
+        counts += self.finish(source)
+        counts["waiting"] = self.store.count_pending(self.alias)
+        print(
+            f"{path}: {counts['upserted']} upserted, {counts['unchanged']} unchanged, "
+            f"{counts['deleted']} deleted"
+        )
+        if counts["skipped"] and self.kind == "business":
+            print(f"{counts['skipped']} businesses outside --states skipped.")
+        elif counts["skipped"]:
+            print(
+                f"{counts['skipped']} reviews of skipped or deleted businesses dropped."
+            )
+        if counts["reviews_moved"] or counts["reviews_deleted"]:
+            print(
+                f"{counts['reviews_moved']} reviews moved and "
+                f"{counts['reviews_deleted']} deleted with their business."
+            )
+        if counts["waiting"]:
+            print(f"{counts['waiting']} reviews are waiting for their business.")
+        return counts
+
+    def checkpoint(self, source, offset):
+        # Only recorded once the batch is in Elasticsearch, so a crash replays
+        # at most one batch and upserts are idempotent.
+        source["offset"] = offset
+        source["inode"], source["read_hash"] = file_identity(source["path"], offset)
+        self.store.save_source(source)
+        self.store.commit()
+
+
+def delete_action(doc):
+    action = {"_op_type": "delete", "_index": doc["index_name"], "_id": doc["doc_id"]}
+    if doc["routing"]:
+        action["_routing"] = doc["routing"]
+    return action
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental Yelp data ingest")
+    parser.add_argument("kind", choices=list(kinds))
+    parser.add_argument("path", help="Yelp JSON lines dump")
+    parser.add_argument(
+        "--states",
+        nargs="+",
+        help="only ingest businesses in these states; reviews follow their business "
+        "and reviews of skipped businesses are dropped, so widen the states with a "
+        "business run and then run reviews with --full-scan",
+    )
+    parser.add_argument("--checkpoint", default=checkpoint_path)
+    parser.add_argument(
+        "--full-scan",
+        action="store_true",
+        help="rescan the whole file and delete documents no longer in it; "
+        "a deleted business takes its reviews with it",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="build fresh indices and swap the alias over when done",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    if args.rebuild and args.states:
+        parser.error("--rebuild replaces every state's partition, drop --states")
+
+    es = Elasticsearch(
+        api_key=os.environ.get("API_KEY"), cloud_id=os.environ.get("CLOUD_ID")
+    )
+    store = CheckpointStore(args.checkpoint)
+    Ingest(es, store, args.kind, args.states).run(
+        args.path,
+        full_scan=args.full_scan,
+        rebuild=args.rebuild,
+        batch_size=args.batch_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
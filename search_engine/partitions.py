@@ -0,0 +1,191 @@
+# Global aliases spanning every per-state partition. They keep the names of the
+# original single indices so unrestricted searches need no changes.
+business_alias = "business_data"
+review_alias = "review_index"
+
+business_mapping = {
+    "properties": {
+        "business_id": {"type": "keyword"},
+        "name": {"type": "text"},
+        "address": {"type": "text"},
+        "city": {"type": "keyword"},
+        "state": {"type": "keyword"},
+        "postal_code": {"type": "keyword"},
+        "location": {"type": "geo_point"},
+        "latitude": {"type": "float"},
+        "longitude": {"type": "float"},
+        "stars": {"type": "float"},
+        "review_count": {"type": "integer"},
+        "is_open": {"type": "boolean"},
+        "attributes": {
+            "properties": {"BusinessAcceptsCreditCards": {"type": "boolean"}}
+        },
+        "categories": {"type": "text"},
+        "hours": {
+            "properties": {
+                "Monday": {"type": "text"},
+                "Tuesday": {"type": "text"},
+                "Wednesday": {"type": "text"},
+                "Thursday": {"type": "text"},
+                "Friday": {"type": "text"},
+                "Saturday": {"type": "text"},
+                "Sunday": {"type": "text"},
+            }
+        },
+    }
+}
+
+review_mapping = {
+    "properties": {
+        "review_id": {"type": "keyword"},
+        "user_id": {"type": "keyword"},
+        "business_id": {"type": "keyword"},
+        "stars": {"type": "integer"},
+        "useful": {"type": "integer"},
+        "funny": {"type": "integer"},
+        "cool": {"type": "integer"},
+        "text": {"type": "text"},
+        "date": {"type": "date"},
+    }
+}
+
+
+def normalize_state(state):
+    return str(state).strip().upper()
+
+
+def routing_keys(ids, limit=20):
+    # Routing only narrows the search while a handful of shards are involved,
+    # and every key goes into the request URL, so long id lists aren't routed.
+    ids = list(ids)
+    if not ids or len(ids) > limit:
+        return None
+    return ",".join(ids)
+
+
+def partition_name(alias, state, generation=None):
+    index_name = f"{alias}_{normalize_state(state).lower()}"
+    if generation is not None:
+        index_name += f"_g{generation}"
+    return index_name
+
+
+def create_partition(es, alias, state, mapping, meta=None, generation=None, live=True):
+    # Partitions created with live=False stay off the alias until
+    # attach_partitions or swap_alias puts them on it.
+    index_name = partition_name(alias, state, generation)
+    if not es.indices.exists(index=index_name):
+        mappings = dict(mapping)
+        mappings["_meta"] = {"state": normalize_state(state), **(meta or {})}
+        es.indices.create(index=index_name, mappings=mappings)
+        print(f"Index '{index_name}' created successfully!")
+    elif meta:
+        extend_partition_bounds(es, index_name, meta)
+    if live:
+        attach_partitions(es, alias, [index_name])
+    return index_name
+
+
+def legacy_index(es, alias):
+    # Before partitioning, business_data and review_index were concrete
+    # indices, and an alias can't be created while an index holds its name.
+    if es.indices.exists(index=alias) and not es.indices.exists_alias(name=alias):
+        return alias
+    return None
+
+
+def attach_partitions(es, alias, index_names):
+    if not index_names:
+        return
+    actions = []
+    legacy = legacy_index(es, alias)
+    if legacy:
+        actions.append({"remove_index": {"index": legacy}})
+        print(f"Replacing legacy index '{legacy}' with alias '{alias}'")
+    actions += [{"add": {"index": name, "alias": alias}} for name in index_names]
+    es.indices.update_aliases(actions=actions)
+
+
+def swap_alias(es, alias, index_names):
+    old_indices = []
+    if es.indices.exists_alias(name=alias):
+        old_indices = list(es.indices.get_alias(name=alias).keys())
+    actions = [{"remove": {"index": name, "alias": alias}} for name in old_indices]
+    legacy = legacy_index(es, alias)
+    if legacy:
+        actions.append({"remove_index": {"index": legacy}})
+    actions += [{"add": {"index": name, "alias": alias}} for name in index_names]
+    es.indices.update_aliases(actions=actions)
+    print(f"Alias '{alias}' now points to {sorted(index_names)}")
+
+    stale = [name for name in old_indices if name not in index_names]
+    if stale:
+        es.indices.delete(index=",".join(stale))
+    return stale
+
+
+def state_bounds(df):
+    # Bounding box of every business in a state, stored in the partition's
+    # _meta so geo queries can skip partitions that cannot match.
+    return {
+        "top_left": {
+            "lat": float(df["latitude"].max()),
+            "lon": float(df["longitude"].min()),
+        },
+        "bottom_right": {
+            "lat": float(df["latitude"].min()),
+            "lon": float(df["longitude"].max()),
+        },
+    }
+
+
+def merge_bounds(bounds, other):
+    if "top_left" not in bounds:
+        return other
+    return {
+        "top_left": {
+            "lat": max(bounds["top_left"]["lat"], other["top_left"]["lat"]),
+            "lon": min(bounds["top_left"]["lon"], other["top_left"]["lon"]),
+        },
+        "bottom_right": {
+            "lat": min(bounds["bottom_right"]["lat"], other["bottom_right"]["lat"]),
+            "lon": max(bounds["bottom_right"]["lon"], other["bottom_right"]["lon"]),
+        },
+    }
+
+
+def extend_partition_bounds(es, index_name, bounds):
+    meta = es.indices.get_mapping(index=index_name)[index_name]["mappings"].get(
+        "_meta", {}
+    )
+    merged = merge_bounds(meta, bounds)
+    if merged != {key: meta.get(key) for key in merged}:
+        es.indices.put_mapping(index=index_name, meta={**meta, **merged})
+
+
+def get_partition_bounds(es, alias=business_alias):
+    response = es.indices.get_mapping(index=alias)
+    return {
+        index_name: body["mappings"].get("_meta", {})
+        for index_name, body in response.items()
+    }
+
+
+def intersects(bounds, top_left, bottom_right):
+    if "top_left" not in bounds or "bottom_right" not in bounds:
+        # No recorded extent, so the partition can't be ruled out.
+        return True
+    return not (
+        bounds["bottom_right"]["lat"] > top_left["lat"]
+        or bounds["top_left"]["lat"] < bottom_right["lat"]
+        or bounds["top_left"]["lon"] > bottom_right["lon"]
+        or bounds["bottom_right"]["lon"] < top_left["lon"]
+    )
+
+
+def route_partitions(partition_bounds, top_left, bottom_right):
+    return sorted(
+        index_name
+        for index_name, bounds in partition_bounds.items()
+        if intersects(bounds, top_left, bottom_right)
+    )
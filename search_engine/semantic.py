@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+model_name = "sentence-transformers/all-MiniLM-L6-v2"
+
+embeddings_file = "embeddings.f16"
+ids_file = "review_ids.json"
+meta_file = "meta.json"
+hnsw_file = "hnsw.bin"
+
+console = Console()
+
+
+# hnswlib and sentence-transformers are only needed once semantic search is
+# switched on, so they are imported on first use.
+def load_model(name=model_name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name, device="cpu")
+
+
+def new_hnsw(dim):
+    import hnswlib
+
+    return hnswlib.Index(space="ip", dim=dim)
+
+
+def build_embeddings(reviews_path, path, batch_size=256, chunksize=10000):
+    # The JSON lines dump is read a chunk at a time and each encoded batch is
+    # appended as raw float16 rows, which load_embeddings maps back with memmap,
+    # so neither the reviews nor the matrix ever sit in memory whole.
+    os.makedirs(path, exist_ok=True)
+    model = load_model()
+    dim = model.get_sentence_embedding_dimension()
+
+    count = 0
+    with open(os.path.join(path, embeddings_file), "wb") as embeddings, open(
+        os.path.join(path, ids_file), "w"
+    ) as ids:
+        ids.write("[")
+        for chunk in pd.read_json(reviews_path, lines=True, chunksize=chunksize):
+            texts = chunk["text"].fillna("").astype(str).tolist()
+            for start in range(0, len(texts), batch_size):
+                batch = model.encode(
+                    texts[start : start + batch_size],
+                    batch_size=batch_size,
+                    normalize_embeddings=True,
+                    convert_to_numpy=True,
+                )
+                embeddings.write(batch.astype(np.float16).tobytes())
+            for review_id in chunk["review_id"].astype(str):
+                ids.write(("," if count else "") + json.dumps(review_id))
+                count += 1
+        ids.write("]")
+
+    with open(os.path.join(path, meta_file), "w") as f:
+        json.dump({"model": model_name, "count": count, "dim": dim}, f)
+    print(f"Embedded {count} reviews into {path}")
+
+
+def load_embeddings(path):
+    with open(os.path.join(path, meta_file)) as f:
+        meta = json.load(f)
+    with open(os.path.join(path, ids_file)) as f:
+        review_ids = json.load(f)
+    embeddings = np.memmap(
+        os.path.join(path, embeddings_file),
+        dtype=np.float16,
+        mode="r",
+        shape=(meta["count"], meta["dim"]),
+    )
+    return embeddings, review_ids, meta
+
+
+def build_hnsw(path, M=16, ef_construction=200, batch_size=50000):
+    embeddings, _, meta = load_embeddings(path)
+    index = new_hnsw(meta["dim"])
+    index.init_index(max_elements=meta["count"], M=M, ef_construction=ef_construction)
+    for start in range(0, meta["count"], batch_size):
+        batch = np.asarray(embeddings[start : start + batch_size], dtype=np.float32)
+        index.add_items(batch, np.arange(start, start + len(batch)))
+    index.save_index(os.path.join(path, hnsw_file))
+    print(f"Built HNSW index over {meta['count']} reviews")
+
+
+def reciprocal_rank_fusion(rankings, k=60, top_n=10):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+
+
+class SemanticIndex:
+    def __init__(self, path, ef=64):
+        self.embeddings, self.review_ids, meta = load_embeddings(path)
+        self.model = load_model(meta["model"])
+        self.index = new_hnsw(meta["dim"])
+        self.index.load_index(os.path.join(path, hnsw_file), max_elements=meta["count"])
+        self.index.set_ef(ef)
+
+    def encode(self, phrase):
+        return self.model.encode(
+            [phrase], normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+    def search(self, phrase, top_n=10):
+        return self.search_vector(self.encode(phrase), top_n)
+
+    def search_vector(self, vector, top_n=10):
+        labels, distances = self.index.knn_query(
+            vector, k=min(top_n, len(self.review_ids))
+        )
+        # The ip space reports 1 - dot product as the distance.
+        return [
+            (self.review_ids[label], 1.0 - float(distance))
+            for label, distance in zip(labels[0], distances[0])
+        ]
+
+    def exact_search(self, phrase, top_n=10):
+        return self.exact_search_vector(self.encode(phrase), top_n)
+
+    def exact_search_vector(self, vector, top_n=10, batch_size=50000):
+        query = vector[0]
+        scores = np.empty(len(self.review_ids), dtype=np.float32)
+        for start in range(0, len(self.review_ids), batch_size):
+            batch = np.asarray(
+                self.embeddings[start : start + batch_size], dtype=np.float32
+            )
+            scores[start : start + len(batch)] = batch @ query
+        top = np.argpartition(-scores, min(top_n, len(scores) - 1))[:top_n]
+        top = top[np.argsort(-scores[top])]
+        return [(self.review_ids[i], float(scores[i])) for i in top]
+
+
+benchmark_queries = [
+    "great pizza",
+    "friendly staff",
+    "slow service",
+    "cheap beer and live music",
+    "best brunch in town",
+    "rude waiter",
+    "fresh seafood",
+    "clean rooms and comfortable beds",
+    "long wait for a table",
+    "amazing barbecue ribs",
+    "overpriced cocktails",
+    "kid friendly place",
+    "authentic mexican tacos",
+    "terrible customer service",
+    "cozy coffee shop to work in",
+    "quick oil change",
+    "vegan options",
+    "dirty bathroom",
+    "great happy hour deals",
+    "helpful pharmacist",
+]
+
+
+def benchmark(semantic_index, queries=benchmark_queries, top_n=10, warmup=3):
+    # Queries are encoded up front so the timings compare only the HNSW lookup
+    # with the exact scan over the memmap, not the shared encoder cost.
+    vectors = [semantic_index.encode(query) for query in queries]
+    for vector in vectors[:warmup]:
+        semantic_index.search_vector(vector, top_n)
+        semantic_index.exact_search_vector(vector, top_n)
+
+    ann_times, exact_times, recalls = [], [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        ann_hits = semantic_index.search_vector(vector, top_n)
+        ann_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        exact_hits = semantic_index.exact_search_vector(vector, top_n)
+        exact_times.append(time.perf_counter() - start)
+
+        exact_ids = {review_id for review_id, _ in exact_hits}
+        ann_ids = {review_id for review_id, _ in ann_hits}
+        recalls.append(len(exact_ids & ann_ids) / max(len(exact_ids), 1))
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Search", width=10)
+    table.add_column(f"Recall@{top_n}", width=12)
+    table.add_column("Mean latency (ms)", width=20)
+    table.add_column("p95 latency (ms)", width=20)
+    for name, times, recall in [
+        ("HNSW", ann_times, np.mean(recalls)),
+        ("Exact", exact_times, 1.0),
+    ]:
+        table.add_row(
+            name,
+            f"{recall:.3f}",
+            f"{np.mean(times) * 1000:.2f}",
+            f"{np.percentile(times, 95) * 1000:.2f}",
+        )
+    console.print(table)
+    print(f"{len(queries)} queries, {warmup} warm-up")
+    return {
+        "recall": float(np.mean(recalls)),
+        "ann_latency": float(np.mean(ann_times)),
+        "exact_latency": float(np.mean(exact_times)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic review search index")
+    parser.add_argument("command", choices=["build", "benchmark"])
+    parser.add_argument("path", help="directory holding the embeddings and index")
+    parser.add_argument("--reviews", help="reviews JSON lines file to embed")
+    parser.add_argument("--queries", nargs="+", default=benchmark_queries)
+    parser.add_argument("--ef", type=int, default=64)
+    parser.add_argument("--top-n", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.reviews is None:
+            parser.error("build needs --reviews")
+        build_embeddings(args.reviews, args.path)
+        build_hnsw(args.path)
+    else:
+        benchmark(SemanticIndex(args.path, ef=args.ef), args.queries, args.top_n)
+
+
+if __name__ == "__main__":
+    main()